@@ -1,27 +1,57 @@
 #!/usr/bin/env python3
 
 import hashlib
+import json
 from os.path import basename
 
-from collections import Counter, namedtuple
-
-from numpy import asarray
+from collections import namedtuple
+
+from numpy import (
+    argsort,
+    asarray,
+    bincount,
+    cumsum,
+    diff,
+    dtype as numpy_dtype,
+    empty,
+    float64,
+    fromiter,
+    int32,
+    int64,
+    isfinite,
+    load,
+    nan,
+    ptp,
+    resize,
+    rint,
+    savez,
+    searchsorted,
+    split,
+    unique,
+)
 from numpy.random import default_rng
 
 try:
-    import pyerrors as pe
+    import numexpr as ne
 except ImportError:
-    pe = None
+    ne = None
 
 
 class FlowEnsemble:
     """
     Represents the data from the gradient flow for a single ensemble.
+
+    Arguments:
+        dtype: The floating point type in which to store the energy densities
+            and topological charges once frozen. Using float32 halves
+            the memory used and the bandwidth needed to process them,
+            at the cost of precision.
     """
 
     _frozen = False
 
-    def __init__(self, filename, reader=None):
+    def __init__(self, filename, reader=None, dtype=float64):
+        self.dtype = dtype
         self.ensemble_names = []
         self.trajectories = []
         self.reader = reader
@@ -33,20 +63,40 @@ class FlowEnsemble:
         self.plaquettes = []
         self.metadata = {}
         self.filename = filename
+        self._Q_history_cache = {}
+        self._Q_history_int_cache = {}
+        self._rng_seed = None
+        self._hs = None
+        self._times_sq = None
+        self._inv_2h = None
+        self._default_Q_history = None
+        self._ensemble_name_codes = None
+        self._times_bytes = None
 
     def __len__(self):
         return len(self.trajectories)
 
+    @property
+    def frozen(self):
+        return self._frozen
+
+    @property
+    def rng_seed(self):
+        """
+        The seed of the generators returned by get_rng.
+        """
+
+        if self._rng_seed is None:
+            self._rng_seed = _filename_seed(self.filename)
+        return self._rng_seed
+
     def get_rng(self):
         """
         Use the base filename of the input file to generate
         a consistent for generating random numbers.
         """
 
-        filename = basename(self.filename)
-        filename_hash = hashlib.md5(filename.encode("utf8")).digest()
-        seed = abs(int.from_bytes(filename_hash, "big"))
-        return default_rng(seed)
+        return default_rng(self.rng_seed)
 
     def append(self, flow, check_consistency=True):
         """
@@ -60,14 +110,28 @@ class FlowEnsemble:
         if self._frozen:
             raise TypeError("Can't append to a frozen ensemble.")
 
+        flow.finalize(check_consistency=check_consistency)
+
+        # Comparing raw bytes is a single memcmp, with none of the
+        # temporary arrays of an elementwise comparison
         if self.times is None:
             self.times = flow.times
-        elif check_consistency and flow.times != self.times:
+            self._times_bytes = self.times.tobytes()
+        elif check_consistency and flow.times.tobytes() != self._times_bytes:
             raise ValueError(
                 f"Times must match for all flows. (Failing at trajectory {flow.trajectory})"
             )
 
-        if not (len(flow.times) == len(flow.Eps) == len(flow.Ecs) == len(flow.Qs)):
+        # Checked even without check_consistency, as freeze copies each flow
+        # into a row of a preallocated array, which would silently broadcast
+        # a flow with a single step across the whole row
+        if not (
+            len(self.times)
+            == len(flow.times)
+            == len(flow.Eps)
+            == len(flow.Ecs)
+            == len(flow.Qs)
+        ):
             raise ValueError(
                 f"Flow for trajectory {flow.trajectory} not a consistent length."
             )
@@ -99,17 +163,84 @@ class FlowEnsemble:
         Turn the lists of data into Numpy arrays for faster operations.
         """
         self.ensemble_names = asarray(self.ensemble_names)
-        self.trajectories = asarray(self.trajectories)
+        self.trajectories = _from_scalars(self.trajectories, int64)
+        # times is only set once a flow has been appended
+        n_times = 0 if self.times is None else len(self.times)
         self.times = asarray(self.times)
-        self.Eps = asarray(self.Eps)
-        self.Ecs = asarray(self.Ecs)
-        self.Qs = asarray(self.Qs)
+        self._freeze_flow_data(n_times)
         if self.plaquettes is not None and len(self.plaquettes) > 0:
-            self.plaquettes = asarray(self.plaquettes)
+            self.plaquettes = _from_scalars(self.plaquettes, float64)
         if self.cfg_filenames is not None and len(self.cfg_filenames) > 0:
             self.cfg_filenames = asarray(self.cfg_filenames)
 
+        self._rng_seed = _filename_seed(self.filename)
         self._frozen = True
+        self._factorize_ensemble_names()
+
+    def to_npz(self, file):
+        """
+        Save a frozen ensemble to a NumPy .npz file, to be loaded with from_npz.
+
+        Arguments:
+            file: The filename or open file to write to.
+        """
+        if not self._frozen:
+            raise TypeError("Only frozen ensembles can be saved.")
+
+        header = {
+            "filename": str(self.filename),
+            "reader": self.reader,
+            "dtype": numpy_dtype(self.dtype).str,
+            "metadata": self.metadata,
+        }
+        arrays = {
+            "header": asarray(json.dumps(header)),
+            "ensemble_names": self.ensemble_names,
+            "trajectories": self.trajectories,
+            "times": self.times,
+            "Eps": self.Eps,
+            "Ecs": self.Ecs,
+            "Qs": self.Qs,
+        }
+        if self.plaquettes is not None:
+            arrays["plaquettes"] = self.plaquettes
+        if self.cfg_filenames is not None:
+            arrays["cfg_filenames"] = self.cfg_filenames
+
+        savez(file, **arrays)
+
+    @classmethod
+    def from_npz(cls, file):
+        """
+        Load an ensemble saved with to_npz.
+
+        Arguments:
+            file: The filename or open file to read from.
+        """
+        with load(file) as data:
+            header = json.loads(str(data["header"]))
+            ensemble = cls(
+                header["filename"],
+                header["reader"],
+                dtype=numpy_dtype(header["dtype"]).type,
+            )
+            ensemble.metadata = header["metadata"]
+            ensemble.ensemble_names = data["ensemble_names"]
+            ensemble.trajectories = data["trajectories"]
+            ensemble.times = data["times"]
+            ensemble.Eps = data["Eps"]
+            ensemble.Ecs = data["Ecs"]
+            ensemble.Qs = data["Qs"]
+            ensemble.plaquettes = data.get("plaquettes")
+            ensemble.cfg_filenames = data.get("cfg_filenames")
+
+        ensemble.freeze()
+        return ensemble
+
+    def _freeze_flow_data(self, n_times):
+        self.Eps = _stack_flows(self.Eps, n_times, self.dtype)
+        self.Ecs = _stack_flows(self.Ecs, n_times, self.dtype)
+        self.Qs = _stack_flows(self.Qs, n_times, self.dtype)
 
     def thin(self, min_trajectory=None, max_trajectory=None, trajectory_step=1):
         """
@@ -120,20 +251,10 @@ class FlowEnsemble:
                 "Thinning an unfrozen ensemble isn't currently supported"
             )
 
-        mask = (
-            (self.trajectories >= min_trajectory if min_trajectory is not None else True)
-            & (
-                self.trajectories <= max_trajectory
-                if max_trajectory is not None
-                else True
-            )
-            & (
-                (self.trajectories - (min_trajectory if min_trajectory else 0))
-                % trajectory_step
-                == 0
-            )
+        mask = _trajectory_mask(
+            self.trajectories, min_trajectory, max_trajectory, trajectory_step
         )
-        result = FlowEnsemble(self.filename, self.reader)
+        result = FlowEnsemble(self.filename, self.reader, dtype=self.dtype)
         result.ensemble_names = self.ensemble_names[mask]
         result.trajectories = self.trajectories[mask]
         result.times = self.times
@@ -141,15 +262,43 @@ class FlowEnsemble:
         result.Ecs = self.Ecs[mask, :]
         result.Qs = self.Qs[mask, :]
         result._frozen = True
+        result._rng_seed = self._rng_seed
         result.metadata = self.metadata
 
         return result
 
+    def _factorize_ensemble_names(self):
+        """
+        Get the sorted unique ensemble names, and an integer code for each
+        configuration giving the position of its ensemble name among these.
+        """
+        if self._ensemble_name_codes is not None:
+            return self._ensemble_name_codes
+
+        names, codes = unique(self.ensemble_names, return_inverse=True)
+        result = names, codes.astype(int32)
+        if self._frozen:
+            self._ensemble_name_codes = result
+        return result
+
+    def _ensemble_indices(self):
+        """
+        Get the sorted unique ensemble names,
+        and the indices of the configurations belonging to each.
+        """
+        names, codes = self._factorize_ensemble_names()
+        if len(names) == 0:
+            return names, []
+
+        # Sort once by code and split according to the size of each ensemble;
+        # a stable sort keeps each ensemble in its original order.
+        order = argsort(codes, kind="stable")
+        boundaries = cumsum(bincount(codes))[:-1]
+        return names, split(order, boundaries)
+
     def group(self, observable):
-        return [
-            observable[self.ensemble_names == ensemble_name]
-            for ensemble_name in sorted(set(self.ensemble_names))
-        ]
+        _, indices = self._ensemble_indices()
+        return [observable[subset_idx] for subset_idx in indices]
 
     def Q_history(self, t="L/2"):
         """
@@ -162,21 +311,69 @@ class FlowEnsemble:
                \\sqrt{8t} ≤ L / 2 is used to determine t.
         """
         if t == "L/2":
+            if self._default_Q_history is not None:
+                return self._default_Q_history
             L = min(self.metadata["NX"], self.metadata["NY"], self.metadata["NZ"])
-            t = L**2 / 32
+            Q_history = self.Q_history(L**2 / 32)
+            # Resolved on first use rather than when freezing,
+            # so that ensembles whose Q is never used don't read it
+            if self._frozen:
+                self._default_Q_history = Q_history
+            return Q_history
+
+        if self._frozen and t in self._Q_history_cache:
+            return self._Q_history_cache[t]
+
+        # times is sorted, as Flow.finalize refuses flows that go backwards
+        t_index = int(searchsorted(self.times, t, side="right")) - 1
+        if t_index < 0:
+            raise ValueError(f"No flow time at or before t={t}.")
+        Q_history = self._Q_at_time_index(t_index)
+        if self._frozen:
+            self._Q_history_cache[t] = Q_history
+        return Q_history
 
-        t_index = (self.times <= t).nonzero()[0][-1]
+    def _Q_at_time_index(self, t_index):
         return self.Qs[:, t_index]
 
+    def Q_history_int(self, t="L/2"):
+        """
+        Get the topological charge Q for each configuration in the ensemble,
+        rounded to the nearest integer.
+
+        Arguments:
+
+            t: The flow time at which Q is measured.
+               If "L/2" is passed (the default), then the relation
+               \\sqrt{8t} ≤ L / 2 is used to determine t.
+        """
+        if self._frozen and t in self._Q_history_int_cache:
+            return self._Q_history_int_cache[t]
+
+        Q_history = self.Q_history(t)
+        if not isfinite(Q_history).all():
+            raise ValueError("Q is not available for all configurations.")
+
+        Q_history_int = rint(Q_history).astype(int32)
+        if self._frozen:
+            self._Q_history_int_cache[t] = Q_history_int
+        return Q_history_int
+
     @property
     def is_adaptive(self):
         tolerance = 1e-5
-        return (self.hs.max() - self.hs.min()) / self.hs.mean() > tolerance
+        hs = self.hs
+        return ptp(hs) / hs.mean() > tolerance
 
     @property
     def hs(self):
-        times = asarray(self.times)
-        return times[1:] - times[:-1]
+        if self._hs is not None:
+            return self._hs
+
+        hs = diff(self.times)
+        if self._frozen:
+            self._hs = hs
+        return hs
 
     @property
     def h(self):
@@ -184,23 +381,49 @@ class FlowEnsemble:
             raise ValueError("Can't get single step size of adaptive flow.")
         return self.hs.mean()
 
-    def get_Es(self, operator):
+    @property
+    def times_sq(self):
+        if self._times_sq is not None:
+            return self._times_sq
+
+        times_sq = self.times**2
+        if self._frozen:
+            self._times_sq = times_sq
+        return times_sq
+
+    @property
+    def inv_2h(self):
+        if self._inv_2h is not None:
+            return self._inv_2h
+
+        inv_2h = 1.0 / (2 * self.h)
+        if self._frozen:
+            self._inv_2h = inv_2h
+        return inv_2h
+
+    def get_Es(self, operator, trajectory_slice=None):
         """
         Get the values of the energy density for a given operator.
 
         Arguments:
             operator: The operator for E to use.
                       Valid options are "plaq" and "sym".
+            trajectory_slice: If given, only return the values for the
+                      configurations it selects.
         """
         if operator == "plaq":
-            return self.Eps
+            Es = self.Eps
         elif operator == "sym":
-            return self.Ecs
+            Es = self.Ecs
         else:
             raise ValueError(
                 f'Invalid operator {operator}. Valid operators are "plaq" and "sym".'
             )
 
+        if trajectory_slice is not None:
+            Es = Es[trajectory_slice]
+        return Es
+
     def get_Es_pyerrors(self, operator, tag=None):
         """
         Get a pyerrors object encapsulating the ensemble of energy density computations
@@ -211,34 +434,31 @@ class FlowEnsemble:
                       Valid options are "plaq" and "sym".
         """
 
-        if pe is None:
+        # pyerrors is slow to import, so only do so when it's needed
+        try:
+            import pyerrors as pe
+        except ImportError:
             raise ImportError("pyerrors is not installed")
 
         Es = self.get_Es(operator)
         all_samples = [[] for _ in range(len(self.times))]
-        ensemble_names = sorted(set(self.ensemble_names))
+        ensemble_names, indices = self._ensemble_indices()
+        ensemble_names = ensemble_names.tolist()
         sample_idxs = []
 
-        for ensemble_name in ensemble_names:
-            subset_idx = self.ensemble_names == ensemble_name
+        for subset_idx in indices:
             ensemble_subset = Es[subset_idx]
             trajectories_subset = self.trajectories[subset_idx]
-            if len(set(trajectories_subset)) != len(trajectories_subset):
-                counts = Counter(trajectories_subset)
-                duplicate_trajectories = [
-                    index for index, count in counts.items() if count > 1
-                ]
+            trajectory_values, counts = unique(trajectories_subset, return_counts=True)
+            if (counts > 1).any():
+                duplicate_trajectories = trajectory_values[counts > 1].tolist()
                 message = f"Can't make a pyerrors object for the ensemble {self.filename} as there are duplicate trajectories: {duplicate_trajectories}"
                 raise ValueError(message)
 
-            for samples in all_samples:
-                samples.append([])
-
-            sample_idxs.append([])
-            for trajectory, flow in zip(trajectories_subset, ensemble_subset):
-                sample_idxs[-1].append(trajectory)
-                for samples, E_value in zip(all_samples, flow):
-                    samples[-1].append(E_value)
+            # One list of samples per flow time, taken a column at a time
+            for samples, E_values in zip(all_samples, ensemble_subset.T):
+                samples.append(E_values.tolist())
+            sample_idxs.append(trajectories_subset.tolist())
 
         observables = [
             pe.Obs(samples, ensemble_names, idl=sample_idxs) for samples in all_samples
@@ -250,20 +470,133 @@ class FlowEnsemble:
         return E_flows_pe
 
 
+def _trajectory_mask(trajectories, min_trajectory, max_trajectory, trajectory_step):
+    """
+    Select the trajectories between min_trajectory and max_trajectory inclusive
+    whose distance from min_trajectory is a multiple of trajectory_step.
+    If numexpr is available, the conditions are evaluated in a single pass.
+    """
+    offset = min_trajectory if min_trajectory else 0
+
+    if ne is not None:
+        conditions = ["((t - offset) % step == 0)"]
+        variables = {"t": trajectories, "offset": offset, "step": trajectory_step}
+        if min_trajectory is not None:
+            conditions.append("(t >= tmin)")
+            variables["tmin"] = min_trajectory
+        if max_trajectory is not None:
+            conditions.append("(t <= tmax)")
+            variables["tmax"] = max_trajectory
+        return ne.evaluate(" & ".join(conditions), local_dict=variables)
+
+    return (
+        (trajectories >= min_trajectory if min_trajectory is not None else True)
+        & (trajectories <= max_trajectory if max_trajectory is not None else True)
+        & ((trajectories - offset) % trajectory_step == 0)
+    )
+
+
+def _filename_seed(filename):
+    """
+    Derive a stable RNG seed from the base name of a file.
+    The hash needn't be cryptographic, only consistent between runs.
+    """
+    filename_hash = hashlib.blake2b(
+        basename(filename).encode("utf8"), digest_size=8
+    ).digest()
+    return int.from_bytes(filename_hash, "big")
+
+
+def _stack_flows(flows, n_times, dtype):
+    """
+    Copy a list of per-configuration arrays into a single (N, T) array.
+    Arrays (e.g. those loaded directly from a file) are only converted
+    if they aren't already of the requested dtype.
+    """
+    if not isinstance(flows, list):
+        return asarray(flows, dtype=dtype)
+
+    result = empty((len(flows), n_times), dtype=dtype)
+    for index, flow in enumerate(flows):
+        result[index] = flow
+    return result
+
+
+def _from_scalars(values, dtype):
+    """
+    Copy a list of per-configuration scalars into a 1D array of the given dtype.
+    Arrays are returned as-is.
+    Lists containing None, such as the trajectories of flows
+    read without one, become object arrays as asarray would give.
+    """
+    if not isinstance(values, list) or None in values:
+        return asarray(values)
+
+    return fromiter(values, dtype=dtype, count=len(values))
+
+
 class Flow:
     """
     Represents the data from the gradient flow for a single configuration.
+
+    Arguments:
+        n_steps: The number of flow time steps, if known in advance.
+            If not given, storage is grown as steps are appended.
     """
 
-    def __init__(self, trajectory=None, ensemble="", cfg_filename=None, plaquette=None):
+    _initial_capacity = 64
+
+    def __init__(
+        self,
+        trajectory=None,
+        ensemble="",
+        cfg_filename=None,
+        plaquette=None,
+        n_steps=None,
+    ):
         self.trajectory = trajectory
         self.ensemble = ensemble
         self.cfg_filename = cfg_filename
         self.plaquette = plaquette
-        self.Eps = []
-        self.Ecs = []
-        self.times = []
-        self.Qs = []
+        self._n_steps = n_steps
+        self._i = 0
+        self._times = None
+        self._Eps = None
+        self._Ecs = None
+        self._Qs = None
+
+    @property
+    def times(self):
+        return self._view(self._times)
+
+    @property
+    def Eps(self):
+        return self._view(self._Eps)
+
+    @property
+    def Ecs(self):
+        return self._view(self._Ecs)
+
+    @property
+    def Qs(self):
+        return self._view(self._Qs)
+
+    def _view(self, buffer):
+        if buffer is None:
+            return empty(0, dtype=float64)
+        return buffer[: self._i]
+
+    def _resize(self, capacity):
+        if self._times is None:
+            self._times = empty(capacity, dtype=float64)
+            self._Eps = empty(capacity, dtype=float64)
+            self._Ecs = empty(capacity, dtype=float64)
+            self._Qs = empty(capacity, dtype=float64)
+        else:
+            self._times = resize(self._times, capacity)
+            self._Eps = resize(self._Eps, capacity)
+            self._Ecs = resize(self._Ecs, capacity)
+            self._Qs = resize(self._Qs, capacity)
 
     def append(self, flowstep, check_consistency=True):
         """
@@ -271,18 +604,73 @@ class Flow:
 
         Arguments:
             flowstep: The instance of FlowStep to append.
-            check_consistency: Verify consistency of a flow.
+            check_consistency: Retained for compatibility; the flow is checked
+                once all steps are present, in finalize().
+        """
+
+        self.append_values(*flowstep)
+
+    def append_values(self, t, Ep, Ec, Q):
+        """
+        Append the data for one flow time step, without first packing it
+        into a FlowStep.
+
+        Arguments:
+            t: The flow time.
+            Ep: The plaquette energy density.
+            Ec: The clover energy density.
+            Q: The topological charge.
+        """
+
+        if self._times is None:
+            self._resize(self._n_steps or self._initial_capacity)
+        elif self._i == len(self._times):
+            # The buffer may be empty, after an empty extend or a finalize
+            self._resize(max(2 * len(self._times), self._initial_capacity))
+
+        self._times[self._i] = t
+        self._Eps[self._i] = Ep
+        self._Ecs[self._i] = Ec
+        self._Qs[self._i] = Q
+        self._i += 1
+
+    def extend_arrays(self, times, Eps, Ecs, Qs):
+        """
+        Append the data for several flow time steps at once.
+
+        Arguments:
+            times: 1D array of flow times.
+            Eps: 1D array of plaquette energy densities at each flow time.
+            Ecs: 1D array of clover energy densities at each flow time.
+            Qs: 1D array of topological charges at each flow time,
+                or None if these weren't measured.
+        """
+
+        end = self._i + len(times)
+        if self._times is None:
+            self._resize(max(end, self._n_steps or 0))
+        elif end > len(self._times):
+            self._resize(max(end, 2 * len(self._times), self._initial_capacity))
+
+        self._times[self._i : end] = times
+        self._Eps[self._i : end] = Eps
+        self._Ecs[self._i : end] = Ecs
+        self._Qs[self._i : end] = nan if Qs is None else Qs
+        self._i = end
+
+    def finalize(self, check_consistency=True):
+        """
+        Release any storage allocated beyond the last step appended.
+
+        Arguments:
+            check_consistency: Verify that the flow time never decreases.
                 Unpredictable behaviour may ensue if these checks are disabled.
         """
+        if self._times is not None and len(self._times) != self._i:
+            self._resize(self._i)
 
-        if check_consistency and self.times and flowstep.t < self.times[-1]:
+        if check_consistency and (diff(self.times) < 0).any():
             raise ValueError("Flow goes backwards.")
-        else:
-            self.times.append(flowstep.t)
-
-        self.Eps.append(flowstep.Ep)
-        self.Ecs.append(flowstep.Ec)
-        self.Qs.append(flowstep.Q)
 
 
 FlowStep = namedtuple("FlowStep", ["t", "Ep", "Ec", "Q"])
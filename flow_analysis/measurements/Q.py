@@ -1,7 +1,5 @@
 #!/usr/bin/env python3
 
-from collections import Counter
-
 import numpy as np
 from scipy.optimize import curve_fit
 
@@ -57,6 +55,7 @@ def flat_bin_Qs(Q_history, t=None):
     Arguments:
 
         Q_history: A list/1D array of Q values, or a FlowEnsemble.
+                   Integer arrays are binned directly without rounding.
         t: The flow time at which Q is measured.
            If "L/2" is passed (the default), then the relation
            \\sqrt{8t} ≤ L / 2 is used to determine t.
@@ -71,22 +70,74 @@ def flat_bin_Qs(Q_history, t=None):
     if isinstance(Q_history, FlowEnsemble):
         if t is None:
             t = "L/2"
-        Q_history = Q_history.Q_history(t)
+        Q_int = Q_history.Q_history_int(t)
     elif t is not None:
         raise ValueError("Cannot recompute Q at a different flow time.")
-
-    Q_bins = Counter(Q_history.round())
-
-    range_min = min(min(Q_bins), -max(Q_bins)) - 1
+    else:
+        Q_history = np.asarray(Q_history)
+        if Q_history.dtype.kind in "iu":
+            # Unsigned values would become floats when offset below
+            Q_int = Q_history.astype(np.int64, copy=False)
+        else:
+            Q_int = np.rint(Q_history).astype(np.int64)
+
+    range_min = min(Q_int.min(), -Q_int.max()) - 1
     range_max = -range_min + 1
     Q_range = np.arange(range_min, range_max)
 
-    # Turn sparse Counter object into dense array
-    Q_counts = np.asarray([Q_bins[Q] for Q in Q_range])
+    # Offset so that range_min lands in the first bin
+    Q_counts = np.bincount(Q_int - range_min, minlength=len(Q_range))
 
     return Q_range, Q_counts
 
 
+def gaussian_initial_guess(Q_range, Q_counts):
+    """
+    Estimate the parameters of a Gaussian describing a histogram of Q
+    in closed form, by a weighted least-squares fit of a parabola
+    to the logarithm of the nonzero counts.
+
+    Arguments:
+
+        Q_range: An array of values of Q
+        Q_counts: An array of counts of each value of Q
+
+    Returns:
+
+        The estimated amplitude, centre, and width,
+        or None if there are too few nonzero counts to fit,
+        if the fitted parabola doesn't open downwards,
+        or if its peak lies outside Q_range.
+    """
+
+    # Empty bins carry no information on the shape of the peak,
+    # and would otherwise dominate the fit when the peak is narrow
+    nonzero = Q_counts > 0
+    if nonzero.sum() < 3:
+        return None
+    Q_range = Q_range[nonzero]
+    Q_counts = Q_counts[nonzero]
+
+    # log(counts) has a variance of roughly 1 / counts
+    weights = Q_counts**0.5
+    design = np.vstack([np.ones_like(Q_range), Q_range, Q_range**2]).T
+    a0, a1, a2 = np.linalg.lstsq(
+        design * weights[:, np.newaxis], np.log(Q_counts) * weights, rcond=None
+    )[0]
+
+    if a2 >= 0:
+        return None
+
+    variance = -1 / (2 * a2)
+    Q0 = a1 * variance
+    A = np.exp(a0 + Q0**2 / (2 * variance))
+    if not np.isfinite([A, Q0, variance]).all():
+        return None
+    if not Q_range.min() <= Q0 <= Q_range.max():
+        return None
+    return A, Q0, variance**0.5
+
+
 def Q_fit(flow_ensemble, t="L/2", with_amplitude=False):
     """
     Fit a Gaussian to the topological charge distribution of an ensemble,
@@ -102,20 +153,22 @@ def Q_fit(flow_ensemble, t="L/2", with_amplitude=False):
 
     Q_history = flow_ensemble.Q_history(t)
 
-    Q_range, Q_counts = flat_bin_Qs(Q_history)
+    Q_range, Q_counts = flat_bin_Qs(flow_ensemble.Q_history_int(t))
 
     # Estimate a sensible starting point for the fit
-    # so it doesn't give up if the peak is a long way away from the default
-    Q_mean = Q_history.mean()
-    Q_std = Q_history.std()
-    Q_amplitude = Q_counts.max()
+    # so it doesn't give up if the peak is a long way away from the default,
+    # and so that it needs few iterations to converge
+    p0 = gaussian_initial_guess(Q_range, Q_counts)
+    if p0 is None:
+        # Fall back to the moments of the distribution
+        p0 = [Q_counts.max(), Q_history.mean(), Q_history.std()]
 
     popt, pcov = curve_fit(
         gaussian,
         Q_range,
         Q_counts,
         sigma=(Q_counts + 1) ** 0.5,
-        p0=[Q_amplitude, Q_mean, Q_std],
+        p0=p0,
         absolute_sigma=True,
     )
 
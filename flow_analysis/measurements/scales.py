@@ -1,15 +1,47 @@
 #!/usr/bin/env python3
 
 import warnings
+from weakref import WeakKeyDictionary
 
-from numpy import argmax
+from numpy import argmax, empty, float64, greater, intp, newaxis, take_along_axis
 
+from ..stats import bootstrap
 from ..stats.bootstrap import (
     bootstrap_finalize,
     bootstrap_finalize_Nd,
     sample_bootstrap_1d,
 )
 
+# Size of the boolean scratch buffer used to find threshold crossings;
+# small enough to stay in cache rather than going out to main memory
+THRESHOLD_BLOCK_BYTES = 2**18
+
+# Bootstrap samples of E for each frozen ensemble,
+# by operator, bootstrap sample count, and seed
+_bs_Es_cache = WeakKeyDictionary()
+
+
+def first_crossings(values, threshold):
+    """
+    Find the index of the first point in each row of values above threshold,
+    or 0 if there is none.
+
+    This is argmax(values > threshold, axis=1), but evaluated a block of rows
+    at a time into one reused buffer, rather than forming the full boolean array.
+    """
+
+    positions = empty(len(values), dtype=intp)
+    block_rows = max(1, THRESHOLD_BLOCK_BYTES // max(1, values.shape[1]))
+    above = empty((min(block_rows, len(values)), values.shape[1]), dtype=bool)
+
+    for start in range(0, len(values), block_rows):
+        block = values[start : start + block_rows]
+        block_above = above[: len(block)]
+        greater(block, threshold, out=block_above)
+        positions[start : start + len(block)] = argmax(block_above, axis=1)
+
+    return positions
+
 
 def threshold_interpolate(flow_ensemble, values, threshold):
     """
@@ -25,27 +57,40 @@ def threshold_interpolate(flow_ensemble, values, threshold):
     if (threshold <= values[:, 0]).any():
         raise ValueError("Some or all flows start above threshold.")
 
-    positions = argmax(values > threshold, axis=1)
+    positions = first_crossings(values, threshold)
 
     if min(positions) == 0:
         bad_ratio = sum(positions == 0) / len(positions)
         warnings.warn(f"{bad_ratio:%} of samples do not reach threshold {threshold}")
-        positions = positions[positions > 0]
+        reached = positions > 0
+        values = values[reached]
+        positions = positions[reached]
         if (positions == 0).all():
             raise ValueError("No flows reach threshold.")
 
-    T_positions_minus_one = values[tuple(zip(*enumerate(positions - 1)))]
-    T_positions = values[tuple(zip(*enumerate(positions)))]
+    T_positions_minus_one = take_along_axis(
+        values, (positions - 1)[:, newaxis], axis=1
+    )[:, 0]
+    T_positions = take_along_axis(values, positions[:, newaxis], axis=1)[:, 0]
+
+    # values may be float32; the interpolation only touches one pair of values
+    # per sample, so is done in double precision
+    T_positions_minus_one = T_positions_minus_one.astype(float64)
+    T_positions = T_positions.astype(float64)
 
     return flow_ensemble.times[positions] + flow_ensemble.h * (
         (threshold - T_positions_minus_one) / (T_positions - T_positions_minus_one)
     )
 
 
-def compute_t2E_samples(flow_ensemble, operator="sym"):
+def compute_bs_Es(flow_ensemble, operator="sym"):
     """
-    Generate a set of bootstrap samples for an ensemble, and
-    compute \\mathcal{E}(t) = t^2 E for each sample.
+    Generate a set of bootstrap samples of E for an ensemble.
+
+    The ensemble's random number generator is seeded identically each time,
+    so the samples for a given operator are always the same;
+    for frozen ensembles they are computed once and shared between
+    observables, and so are returned read-only.
 
     Arguments:
         flow_ensemble: The FlowEnsemble to evaluate for.
@@ -53,10 +98,38 @@ def compute_t2E_samples(flow_ensemble, operator="sym"):
                   Valid options are "plaq" and "sym".
                   Default: sym.
     """
+
+    # The sample count is looked up when called, as it may be changed
+    key = (operator, bootstrap.BOOTSTRAP_SAMPLE_COUNT, flow_ensemble.rng_seed)
+    if flow_ensemble.frozen:
+        cached_samples = _bs_Es_cache.setdefault(flow_ensemble, {})
+        if key in cached_samples:
+            return cached_samples[key]
+
     bs_Es = sample_bootstrap_1d(
         flow_ensemble.get_Es(operator), rng=flow_ensemble.get_rng()
     )
-    return flow_ensemble.times**2 * bs_Es
+
+    if flow_ensemble.frozen:
+        bs_Es.setflags(write=False)
+        cached_samples[key] = bs_Es
+    return bs_Es
+
+
+def compute_t2E_samples(flow_ensemble, operator="sym"):
+    """
+    Generate a set of bootstrap samples for an ensemble, and
+    compute \\mathcal{E}(t) = t^2 E for each sample.
+
+    Arguments:
+        flow_ensemble: The FlowEnsemble to evaluate for.
+        operator: The operator for E to use.
+                  Valid options are "plaq" and "sym".
+                  Default: sym.
+    """
+    bs_Es = compute_bs_Es(flow_ensemble, operator)
+    # Stay in the precision of the ensemble's data, rather than promoting to float64
+    return flow_ensemble.times_sq.astype(bs_Es.dtype, copy=False) * bs_Es
 
 
 def compute_t2E_t(flow_ensemble, operator="sym"):
@@ -125,13 +198,22 @@ def compute_wt_samples(flow_ensemble, operator="sym"):
                   Default: sym.
     """
 
-    bs_Es = sample_bootstrap_1d(
-        flow_ensemble.get_Es(operator), rng=flow_ensemble.get_rng()
-    )
+    bs_Es = compute_bs_Es(flow_ensemble, operator)
     times = flow_ensemble.times
-
-    t2E = times**2 * bs_Es
-    t_dt2E_dt = times[1:-1] * (t2E[:, 2:] - t2E[:, :-2]) / (2 * flow_ensemble.h)
+    times_sq = flow_ensemble.times_sq
+
+    # Central difference of t^2 E, multiplied by t, with the factors of t
+    # folded into one coefficient for each side of the difference,
+    # so that bs_Es is read once and no t^2 E array is formed.
+    # The coefficients are cast to the precision of bs_Es,
+    # so that a float32 ensemble is differentiated in float32 throughout.
+    coefficient_plus = times[1:-1] * times_sq[2:] * flow_ensemble.inv_2h
+    coefficient_minus = times[1:-1] * times_sq[:-2] * flow_ensemble.inv_2h
+    coefficient_plus = coefficient_plus.astype(bs_Es.dtype, copy=False)
+    coefficient_minus = coefficient_minus.astype(bs_Es.dtype, copy=False)
+
+    t_dt2E_dt = bs_Es[:, 2:] * coefficient_plus
+    t_dt2E_dt -= bs_Es[:, :-2] * coefficient_minus
 
     return t_dt2E_dt
 
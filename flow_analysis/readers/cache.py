@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import tempfile
+from contextlib import suppress
+from functools import wraps
+from inspect import signature
+from pathlib import Path
+from zipfile import BadZipFile
+
+from ..flow import FlowEnsemble
+
+# Increment when a change to a reader alters what it returns,
+# so that ensembles cached by earlier versions aren't used
+CACHE_VERSION = 1
+
+# The most ensembles to keep; the least recently used are removed beyond this
+CACHE_MAX_ENTRIES = 32
+
+
+def default_cache_directory():
+    """
+    Find the per-user directory to keep parsed ensembles in,
+    following the XDG base directory specification.
+    Returns None, disabling the cache,
+    if the FLOW_ANALYSIS_NO_CACHE environment variable is set.
+    """
+
+    if os.environ.get("FLOW_ANALYSIS_NO_CACHE"):
+        return None
+
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        try:
+            cache_home = Path.home() / ".cache"
+        except RuntimeError:
+            # No home directory to cache in
+            return None
+    return Path(cache_home) / "flow_analysis"
+
+
+# Where parsed ensembles are kept between runs; set to None to disable
+CACHE_DIRECTORY = default_cache_directory()
+
+
+def cache_path(reader, arguments):
+    """
+    Find where the result of reading a file with a given reader and arguments
+    would be cached.
+    The key includes the file's modification time and size,
+    so a file that has changed since it was cached is read again.
+
+    Arguments:
+        reader: The reader function.
+        arguments: The arguments the reader is called with, including defaults.
+    """
+
+    file_stat = os.stat(arguments["filename"])
+    key = repr(
+        (
+            CACHE_VERSION,
+            reader.__module__,
+            reader.__qualname__,
+            os.path.abspath(arguments["filename"]),
+            file_stat.st_mtime_ns,
+            file_stat.st_size,
+            sorted((name, repr(value)) for name, value in arguments.items()),
+        )
+    )
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return CACHE_DIRECTORY / f"flow_{digest}.npz"
+
+
+def write_cache(ensemble, path):
+    # Write to a temporary file first, so that an interrupted write
+    # never leaves a partial cache behind
+    temporary_path = None
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, suffix=".npz", delete=False
+        ) as f:
+            temporary_path = f.name
+            ensemble.to_npz(f)
+        os.replace(temporary_path, path)
+    except (OSError, TypeError, ValueError):
+        # e.g. a read-only directory, or metadata that can't be stored as JSON
+        if temporary_path is not None:
+            with suppress(OSError):
+                os.remove(temporary_path)
+
+
+def prune_cache(directory):
+    """
+    Remove all but the CACHE_MAX_ENTRIES most recently used ensembles
+    from the cache.
+    """
+
+    entries = []
+    for path in directory.glob("flow_*.npz"):
+        with suppress(OSError):
+            entries.append((path.stat().st_mtime_ns, path))
+    entries.sort(reverse=True)
+    for _, path in entries[CACHE_MAX_ENTRIES:]:
+        with suppress(OSError):
+            path.unlink()
+
+
+def disk_cached(reader):
+    """
+    Keep the ensembles read by a reader in .npz files,
+    so that re-running an analysis doesn't need to parse its logs again.
+    Calls with a metadata_callback aren't cached,
+    as the callback may do anything.
+    Failing to read or write the cache is never an error;
+    the file is then just read as normal.
+    """
+
+    reader_signature = signature(reader)
+
+    @wraps(reader)
+    def cached_reader(*args, **kwargs):
+        bound_arguments = reader_signature.bind(*args, **kwargs)
+        bound_arguments.apply_defaults()
+        arguments = bound_arguments.arguments
+        if CACHE_DIRECTORY is None or arguments.get("metadata_callback") is not None:
+            return reader(*args, **kwargs)
+
+        try:
+            path = cache_path(reader, arguments)
+        except OSError:
+            return reader(*args, **kwargs)
+
+        if path.exists():
+            try:
+                ensemble = FlowEnsemble.from_npz(path)
+            except (OSError, KeyError, ValueError, BadZipFile):
+                pass
+            else:
+                # Mark as recently used, so that it is kept when pruning
+                with suppress(OSError):
+                    os.utime(path)
+                return ensemble
+
+        ensemble = reader(*args, **kwargs)
+        if ensemble is not None:
+            write_cache(ensemble, path)
+            prune_cache(path.parent)
+        return ensemble
+
+    return cached_reader
@@ -1,19 +1,40 @@
 #!/usr/bin/env python3
 
+import re
 from functools import lru_cache
-from re import match
 
-from numpy import nan
+from numpy import float64, nan
 
-from ..flow import FlowStep, Flow, FlowEnsemble
+from ..flow import Flow, FlowEnsemble
+from .cache import disk_cached
+
+# The kinds of [WilsonFlow] measurement line, keyed on their 9th-11th words
+WILSONFLOW_LINE_KINDS = {
+    (b"Energy", b"density", b"(plaq)"): "plaq",
+    (b"Energy", b"density", b"(cloverleaf)"): "cloverleaf",
+    (b"Top.", b"charge", b":"): "charge",
+}
+
+
+# Configuration filenames, either named for the run and its parameters
+# or as Grid checkpoints
+CFG_FILENAME = re.compile(
+    r".*/([^/]*)_[0-9]+x[0-9]+x[0-9]+x[0-9]+nc[0-9]+(?:r[A-Z]+)?(?:nf[0-9]+)?b[0-9]+\.[0-9]+m-?[0-9]+\.[0-9]+n([0-9]+)"
+)
+CHECKPOINT_FILENAME = re.compile(
+    r".*?/(?:(run[^/]*)/)?(?:cnfg/)?ckpoint_.*lat.([0-9]+)"
+)
 
 
 def add_metadata(metadata, line_contents):
-    if line_contents[7:10] == ["Global", "lattice", "size"]:
+    if line_contents[7:10] == [b"Global", b"lattice", b"size"]:
         metadata["NX"] = int(line_contents[11])
         metadata["NY"] = int(line_contents[12])
         metadata["NZ"] = int(line_contents[13])
         metadata["NT"] = int(line_contents[14])
+        return True
+
+    return False
 
 
 def parse_cfg_filename(filename):
@@ -30,14 +51,9 @@ def parse_cfg_filename(filename):
         cfg_index: The index of the trajectory in the stream
     """
 
-    matched_filename = match(
-        r".*/([^/]*)_[0-9]+x[0-9]+x[0-9]+x[0-9]+nc[0-9]+(?:r[A-Z]+)?(?:nf[0-9]+)?b[0-9]+\.[0-9]+m-?[0-9]+\.[0-9]+n([0-9]+)",
-        filename,
-    )
+    matched_filename = CFG_FILENAME.match(filename)
     if not matched_filename:
-        matched_filename = match(
-            r".*?/(?:(run[^/]*)/)?(?:cnfg/)?ckpoint_.*lat.([0-9]+)", filename
-        )
+        matched_filename = CHECKPOINT_FILENAME.match(filename)
 
     run_name, cfg_index = matched_filename.groups()
     if run_name is None:
@@ -46,17 +62,22 @@ def parse_cfg_filename(filename):
 
 
 @lru_cache(maxsize=8)
-def read_flows_grid(filename, check_consistency=True):
-    flows = FlowEnsemble(filename, "grid")
+@disk_cached
+def read_flows_grid(filename, check_consistency=True, dtype=float64):
+    flows = FlowEnsemble(filename, "grid", dtype=dtype)
     flow = None
     Ep_idx = None
     Ec_idx = None
     Ep = None
     Ec = None
     Q_idx = None
+    metadata_seen = False
 
-    with open(filename) as f:
-        for line in f.readlines():
+    # Stream the log a line at a time rather than holding all of it in memory.
+    # Lines are split as bytes, as only the few tokens that are used
+    # need to be converted, and float() and int() accept bytes directly.
+    with open(filename, "rb", buffering=2**20) as f:
+        for line in f:
             line_contents = line.split()
 
             if len(line_contents) < 8:
@@ -64,37 +85,44 @@ def read_flows_grid(filename, check_consistency=True):
 
             if (
                 len(line_contents) > 8
-                and line_contents[8] == "Configuration"
-                and line_contents[-1] == "agree"
+                and line_contents[8] == b"Configuration"
+                and line_contents[-1] == b"agree"
             ):
                 if flow:
                     flows.append(flow, check_consistency=check_consistency)
 
-                ensemble, trajectory = parse_cfg_filename(line_contents[9])
-                flow = Flow(trajectory=trajectory, ensemble=ensemble)
+                ensemble, trajectory = parse_cfg_filename(line_contents[9].decode())
+                # Every flow has the same number of steps as the first,
+                # so after that its storage can be allocated up front
+                flow = Flow(
+                    trajectory=trajectory,
+                    ensemble=ensemble,
+                    n_steps=None if flows.times is None else len(flows.times),
+                )
 
-            add_metadata(flows.metadata, line_contents)
+            if not metadata_seen:
+                metadata_seen = add_metadata(flows.metadata, line_contents)
 
-            if line_contents[7] != "[WilsonFlow]" or len(line_contents) < 13:
+            if line_contents[7] != b"[WilsonFlow]" or len(line_contents) < 13:
                 continue
 
-            if line_contents[8:11] == ["Energy", "density", "(plaq)"]:
+            kind = WILSONFLOW_LINE_KINDS.get(
+                (line_contents[8], line_contents[9], line_contents[10])
+            )
+            if kind == "plaq":
                 Ep_idx = int(line_contents[12])
                 flow_time = float(line_contents[13])
                 Ep = float(line_contents[14]) / flow_time**2
-            elif line_contents[8:11] == ["Energy", "density", "(cloverleaf)"]:
+            elif kind == "cloverleaf":
                 Ec_idx = int(line_contents[12])
                 flow_time = float(line_contents[13])
                 Ec = float(line_contents[14]) / flow_time**2
-            elif line_contents[8:10] == ["Top.", "charge"]:
+            elif kind == "charge":
                 Q_idx = int(line_contents[11])
                 Q = float(line_contents[12])
 
             if (Ep_idx is not None or Ec_idx is not None) and Ep_idx == Q_idx:
-                flow.append(
-                    FlowStep(flow_time, Ep or nan, Ec or nan, Q),
-                    check_consistency=check_consistency,
-                )
+                flow.append_values(flow_time, Ep or nan, Ec or nan, Q)
                 Ep_idx = None
                 Ec_idx = None
                 Q_idx = None
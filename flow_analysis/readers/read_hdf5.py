@@ -5,6 +5,8 @@ try:
 except ImportError:
     h5py = None
 
+from numpy import asarray, float64
+
 from ..flow import FlowEnsemble
 
 
@@ -15,19 +17,83 @@ def get_metadata(group):
     return {"NT": NT, "NX": NX, "NY": NY, "NZ": NZ, "beta": beta, "mAS": mAS}
 
 
-def read_flows_hdf5(filename, group_name="/"):
+def _dataset_property(name):
+    def get(self):
+        if name not in self._arrays:
+            self._arrays[name] = asarray(self._datasets[name][()], dtype=self.dtype)
+        return self._arrays[name]
+
+    def set(self, value):
+        self._arrays[name] = value
+
+    return property(get, set)
+
+
+class HDF5FlowEnsemble(FlowEnsemble):
+    """
+    A FlowEnsemble whose energy densities and topological charges are left
+    in the HDF5 file until they are first used,
+    so that only the data that are needed are read.
+
+    Arguments:
+        group: The HDF5 group holding the ensemble.
+    """
+
+    Eps = _dataset_property("Eps")
+    Ecs = _dataset_property("Ecs")
+    Qs = _dataset_property("Qs")
+
+    def __init__(self, filename, group, dtype=float64):
+        self._datasets = {
+            "Eps": group["energy density plaq"],
+            "Ecs": group["energy density sym"],
+            "Qs": group["topological charge"],
+        }
+        self._arrays = {}
+        super().__init__(filename, reader="hdf5", dtype=dtype)
+
+        # Discard the empty lists that FlowEnsemble sets up to append flows to
+        self._arrays.clear()
+
+    def _freeze_flow_data(self, n_times):
+        # The datasets are already two-dimensional, so need no stacking
+        pass
+
+    def get_Es(self, operator, trajectory_slice=None):
+        """
+        Get the values of the energy density for a given operator.
+        If only some configurations are requested,
+        and the rest haven't already been read, read only those from the file.
+
+        Arguments:
+            operator: The operator for E to use.
+                      Valid options are "plaq" and "sym".
+            trajectory_slice: If given, only return the values for the
+                      configurations it selects.
+        """
+        name = {"plaq": "Eps", "sym": "Ecs"}.get(operator)
+        if trajectory_slice is None or name is None or name in self._arrays:
+            return super().get_Es(operator, trajectory_slice)
+
+        return asarray(self._datasets[name][trajectory_slice], dtype=self.dtype)
+
+    def _Q_at_time_index(self, t_index):
+        # Read only the one flow time needed, unless all of Q is already read
+        if "Qs" in self._arrays:
+            return super()._Q_at_time_index(t_index)
+        return asarray(self._datasets["Qs"][:, t_index], dtype=self.dtype)
+
+
+def read_flows_hdf5(filename, group_name="/", dtype=float64):
     if h5py is None:
         raise ImportError("h5py is not installed")
 
     h5file = h5py.File(filename, "r")
     group = h5file[group_name]
 
-    ensemble = FlowEnsemble(filename, reader="hdf5")
+    ensemble = HDF5FlowEnsemble(filename, group, dtype=dtype)
     ensemble.ensemble_names = group["ensemble names"][:]
     ensemble.trajectories = group["trajectory indices"][:]
-    ensemble.Eps = group["energy density plaq"][:]
-    ensemble.Ecs = group["energy density sym"][:]
-    ensemble.Qs = group["topological charge"][:]
     ensemble.times = group["flow times"][:]
     ensemble.cfg_filenames = group["configurations"][:]
 
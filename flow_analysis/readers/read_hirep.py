@@ -1,9 +1,32 @@
 #!/usr/bin/env python3
 
+import re
 from functools import lru_cache
-from re import match
 
-from ..flow import FlowStep, Flow, FlowEnsemble
+from numpy import float64, fromstring
+
+from ..flow import Flow, FlowEnsemble
+from .cache import disk_cached
+
+# Captures t, E, Esym, and TC from a flow measurement.
+# There are two versions of HiRep flow logs;
+# one has an extra ncnfg field that can safely be ignored.
+WILSONFLOW_LINE = re.compile(
+    rb"\[WILSONFLOW\]\[0\]WF\s+(?:\(ncnfg\S*\s+\S+\s+\S+|\S+\s+\S+)"
+    rb"\s+(\S+)\s+(\S+)\s+\S+\s+(\S+)\s+\S+\s+(\S+)"
+)
+
+# Other lines the reader needs to look at
+HEADER_PREFIXES = (b"[IO][0]Configuration", b"[GEOMETRY")
+
+LATTICE_SIZE = re.compile("([0-9]+)x([0-9]+)x([0-9]+)x([0-9]+)")
+
+# The greedy leading .* is part of how run names have always been parsed:
+# it makes the run name start as late in the filename as possible,
+# so it must be kept for ensemble names to stay the same.
+CFG_FILENAME = re.compile(
+    r".*([^/]*_[0-9]+x[0-9]+x[0-9]+x[0-9]+nc[0-9]+(?:r[A-Z]+)?(?:nf[0-9]+)?(?:b[0-9]+\.[0-9]+)?(?:m-?[0-9]+\.[0-9]+)?)n([0-9]+)"
+)
 
 
 def add_metadata(metadata, line_contents):
@@ -11,13 +34,14 @@ def add_metadata(metadata, line_contents):
         line_contents[0] == "[GEOMETRY][0]Global"
         or line_contents[0] == "[GEOMETRY_INIT][0]Global"
     ):
-        NT, NX, NY, NZ = map(
-            int, match("([0-9]+)x([0-9]+)x([0-9]+)x([0-9]+)", line_contents[3]).groups()
-        )
+        NT, NX, NY, NZ = map(int, LATTICE_SIZE.match(line_contents[3]).groups())
         metadata["NT"] = NT
         metadata["NX"] = NX
         metadata["NY"] = NY
         metadata["NZ"] = NZ
+        return True
+
+    return False
 
 
 def parse_cfg_filename(filename):
@@ -34,64 +58,81 @@ def parse_cfg_filename(filename):
         cfg_index: The index of the trajectory in the stream
     """
 
-    matched_filename = match(
-        r".*([^/]*_[0-9]+x[0-9]+x[0-9]+x[0-9]+nc[0-9]+(?:r[A-Z]+)?(?:nf[0-9]+)?(?:b[0-9]+\.[0-9]+)?(?:m-?[0-9]+\.[0-9]+)?)n([0-9]+)",
-        filename,
-    )
+    matched_filename = CFG_FILENAME.match(filename)
     run_name, cfg_index = matched_filename.groups()
     return run_name, int(cfg_index)
 
 
-@lru_cache(maxsize=8)
-def read_flows_hirep(
-    filename, metadata_callback=lambda metadata, line: None, check_consistency=False
-):
-    flows = FlowEnsemble(filename, "hirep")
-    flow = None
-    flows.metadata["flow_type"] = "Wilson"
-
-    with open(filename) as f:
-        for line in f.readlines():
-            line_contents = line.split()
-            if not line_contents:
-                continue
-
-            if (
-                line_contents[0] == "[IO][0]Configuration"
-                and line_contents[2] == "read"
-            ):
-                if flow:
-                    flows.append(flow, check_consistency=check_consistency)
-
-                ensemble, trajectory = parse_cfg_filename(line_contents[1])
-                flow = Flow(
-                    trajectory=trajectory,
-                    ensemble=ensemble,
-                    plaquette=float(line_contents[-1].split("=")[-1]),
-                    cfg_filename=line_contents[1].strip("[]"),
-                )
-
-            add_metadata(flows.metadata, line_contents)
-            metadata_callback(flows.metadata, line_contents)
-
-            if line_contents[0] != "[WILSONFLOW][0]WF":
-                continue
+def parse_flow_fields(fields):
+    """
+    Convert space-separated t, E, Esym, and TC fields from successive flow
+    measurements in a single call, returning one row per measurement.
+    """
+    return fromstring(fields, sep=" ").reshape(-1, 4)
 
-            if line_contents[1].startswith("(ncnfg"):
-                # There are two versions of HiRep flow logs
-                # One has an extra field that can safely be ignored
-                del line_contents[3]
 
-            flow_time = float(line_contents[3])
+def extend_flow(flow, fields):
+    if flow is None:
+        raise ValueError("Flow measured before any configuration was read.")
+    flow.extend_arrays(*parse_flow_fields(b" ".join(fields)).T)
+    fields.clear()
 
-            Ep = float(line_contents[4])
-            Ec = float(line_contents[6])
-            Q = float(line_contents[8])
 
-            flow.append(
-                FlowStep(flow_time, Ep, Ec, Q), check_consistency=check_consistency
-            )
+@lru_cache(maxsize=8)
+@disk_cached
+def read_flows_hirep(
+    filename,
+    metadata_callback=None,
+    check_consistency=False,
+    dtype=float64,
+):
+    flows = FlowEnsemble(filename, "hirep", dtype=dtype)
+    flows.metadata["flow_type"] = "Wilson"
 
+    flow = None
+    metadata_seen = False
+
+    # The fields of the current flow's measurements, converted together
+    # once the flow is complete rather than a line at a time
+    fields = []
+
+    # Stream the log a line at a time rather than holding all of it in memory.
+    # Most lines are flow measurements, which are matched directly as bytes
+    # without being decoded or split; only header lines are tokenised.
+    with open(filename, "rb", buffering=2**20) as f:
+        for line in f:
+            wilson_flow = WILSONFLOW_LINE.match(line)
+            if wilson_flow:
+                fields.extend(wilson_flow.groups())
+
+            elif line.startswith(HEADER_PREFIXES):
+                line_contents = line.decode().split()
+                if (
+                    line_contents[0] == "[IO][0]Configuration"
+                    and line_contents[2] == "read"
+                ):
+                    if fields:
+                        extend_flow(flow, fields)
+                    if flow:
+                        flows.append(flow, check_consistency=check_consistency)
+
+                    ensemble, trajectory = parse_cfg_filename(line_contents[1])
+                    flow = Flow(
+                        trajectory=trajectory,
+                        ensemble=ensemble,
+                        plaquette=float(line_contents[-1].split("=")[-1]),
+                        cfg_filename=line_contents[1].strip("[]"),
+                    )
+                elif not metadata_seen:
+                    metadata_seen = add_metadata(flows.metadata, line_contents)
+
+            if metadata_callback is not None:
+                line_contents = line.decode().split()
+                if line_contents:
+                    metadata_callback(flows.metadata, line_contents)
+
+    if fields:
+        extend_flow(flow, fields)
     if flow is None:
         return
 
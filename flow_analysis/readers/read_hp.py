@@ -2,38 +2,38 @@
 
 from functools import lru_cache
 
-from ..flow import FlowStep, Flow, FlowEnsemble
+from numpy import concatenate, diff, flatnonzero, float64, loadtxt
+
+from ..flow import Flow, FlowEnsemble
+from .cache import disk_cached
 
 
 @lru_cache(maxsize=8)
-def read_flows_hp(filename):
-    flows = FlowEnsemble(filename, "hp")
-    flow = None
-    previous_line_trajectory = None
-    previous_line_flow_time = None
-
-    with open(filename) as f:
-        for line in f.readlines():
-            line_contents = line.split()
-            trajectory = int(line_contents[0])
-            flow_time, Ep, Ec = map(float, line_contents[1:])
-
-            if previous_line_flow_time is None or flow_time < previous_line_flow_time:
-                if (
-                    previous_line_trajectory
-                    and previous_line_trajectory != trajectory - 1
-                ):
-                    raise ValueError("Configuration indices don't increment nicely.")
-                if flow:
-                    flows.append(flow)
-
-                flow = Flow(trajectory=trajectory)
-                previous_line_flow_time = 0
-
-            flow.append(FlowStep(flow_time, Ep, Ec, None))
-            previous_line_trajectory = trajectory
-            previous_line_flow_time = flow_time
-
-    flows.append(flow)
+@disk_cached
+def read_flows_hp(filename, dtype=float64):
+    flows = FlowEnsemble(filename, "hp", dtype=dtype)
+
+    data = loadtxt(filename, ndmin=2)
+    trajectories = data[:, 0].astype(int)
+    flow_times = data[:, 1]
+
+    # Each configuration's flow starts where the flow time goes back down
+    flow_starts = flatnonzero(diff(flow_times) < 0) + 1
+    previous_trajectories = trajectories[flow_starts - 1]
+    if (
+        (previous_trajectories != 0)
+        & (previous_trajectories != trajectories[flow_starts] - 1)
+    ).any():
+        raise ValueError("Configuration indices don't increment nicely.")
+
+    starts = concatenate(([0], flow_starts))
+    ends = concatenate((flow_starts, [len(data)]))
+    for start, end in zip(starts, ends):
+        flow = Flow(trajectory=int(trajectories[start]), n_steps=end - start)
+        flow.extend_arrays(
+            flow_times[start:end], data[start:end, 2], data[start:end, 3], None
+        )
+        flows.append(flow)
+
     flows.freeze()
     return flows
@@ -15,13 +15,18 @@ def autocorr(series, cutoff=None):
 
     if not cutoff:
         cutoff = len(series) // 2
-    acf = np.zeros(cutoff - 1)
-    zero_centered_series = series - np.mean(series)
+    zero_centered_series = np.asarray(series) - np.mean(series)
+    length = len(zero_centered_series)
+
+    # The sums of lagged products at every lag are the inverse transform of
+    # the power spectrum; padding to twice the length stops them wrapping around
+    spectrum = np.fft.rfft(zero_centered_series, n=2 * length)
+    lagged_sums = np.fft.irfft(spectrum.real**2 + spectrum.imag**2, n=2 * length)
+
+    # Divide by the number of products at each lag to get their means
+    acf = lagged_sums[: cutoff - 1] / np.arange(length, length - cutoff + 1, -1)
+    acf /= np.var(zero_centered_series)
     acf[0] = 1
-    for i in range(1, cutoff - 1):
-        acf[i] = np.mean(zero_centered_series[:-i] * zero_centered_series[i:]) / np.var(
-            zero_centered_series
-        )
     return acf
 
 
@@ -1,12 +1,30 @@
 #!/usr/bin/env python3
 
-from numpy import mean, std, asarray, empty
-from numpy.random import default_rng
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from numpy import (
+    mean,
+    std,
+    asarray,
+    ascontiguousarray,
+    concatenate,
+    float32,
+    float64,
+    full,
+)
+from numpy.random import SeedSequence, default_rng
 
 from uncertainties import ufloat
 
 BOOTSTRAP_SAMPLE_COUNT = 200
 
+# 1D bootstraps are drawn in chunks of BOOTSTRAP_CHUNK_SIZE samples;
+# those with more work than PARALLEL_BOOTSTRAP_MIN_SIZE (samples x values)
+# compute their chunks in parallel
+BOOTSTRAP_CHUNK_SIZE = 25
+PARALLEL_BOOTSTRAP_MIN_SIZE = 2**26
+
 # Note: Using default RNG will not give exactly reproducible output
 DEFAULT_RNG = default_rng()
 
@@ -19,12 +37,21 @@ def bootstrap_finalize_Nd(samples, axis=None):
     return mean(samples, axis=axis), std(samples, axis=axis)
 
 
-def sample_bootstrap_0d(values, rng=DEFAULT_RNG):
+def resample(values, rng=DEFAULT_RNG):
+    """
+    Draw all bootstrap resamples of a 1D set of values in one gather.
+
+    Returns a (BOOTSTRAP_SAMPLE_COUNT, len(values)) array, each row of
+    which is one resample; the indices drawn are the same as those of
+    BOOTSTRAP_SAMPLE_COUNT successive calls to rng.choice.
+    """
     values = asarray(values)
-    samples = []
-    for _ in range(BOOTSTRAP_SAMPLE_COUNT):
-        samples.append(mean(rng.choice(values, len(values))))
-    return asarray(samples)
+    indices = rng.integers(0, len(values), size=(BOOTSTRAP_SAMPLE_COUNT, len(values)))
+    return values[indices]
+
+
+def sample_bootstrap_0d(values, rng=DEFAULT_RNG):
+    return resample(values, rng).mean(axis=1)
 
 
 def basic_bootstrap(values, rng=DEFAULT_RNG):
@@ -32,22 +59,48 @@ def basic_bootstrap(values, rng=DEFAULT_RNG):
 
 
 def bootstrap_susceptibility(values, rng=DEFAULT_RNG):
-    values = asarray(values)
-    samples = []
-    for _ in range(BOOTSTRAP_SAMPLE_COUNT):
-        current_sample = rng.choice(values, len(values))
-        samples.append(mean(current_sample**2) - mean(current_sample) ** 2)
+    resamples = resample(values, rng)
+    samples = (resamples**2).mean(axis=1) - resamples.mean(axis=1) ** 2
     return bootstrap_finalize(samples)
 
 
-def sample_bootstrap_1d(values, rng=DEFAULT_RNG):
+def weighted_bootstrap_means(values, sample_count, rng):
+    config_count = values.shape[0]
+
+    # Each row of weights counts how many times each configuration is drawn
+    # for one bootstrap sample, so all sample means are one matrix product
+    weights = rng.multinomial(
+        config_count,
+        full(config_count, 1 / config_count),
+        size=sample_count,
+    ).astype(values.dtype)
+    return (weights @ values) / config_count
+
+
+def sample_bootstrap_1d(values, rng=DEFAULT_RNG, max_workers=None):
+    # The matrix product only runs at full speed in BLAS when values is
+    # C-contiguous and single or double precision, so make sure it is;
+    # column slices of an ensemble's arrays would otherwise be strided
     values = asarray(values)
-    bootstrap_sample_configurations = rng.integers(
-        values.shape[0], size=(BOOTSTRAP_SAMPLE_COUNT, values.shape[0])
+    values = ascontiguousarray(
+        values, dtype=float32 if values.dtype == float32 else float64
     )
-    bootstrap_samples = empty((BOOTSTRAP_SAMPLE_COUNT, values.shape[1]))
-    for t_index in range(values.shape[1]):
-        bootstrap_samples[:, t_index] = values[
-            bootstrap_sample_configurations, t_index
-        ].mean(axis=1)
-    return asarray(bootstrap_samples)
+
+    # The samples are always drawn in the same chunks, each from its own
+    # stream spawned from rng, so they depend neither on the size of values,
+    # nor on whether or by how many workers the chunks are computed
+    chunk_sizes = [
+        min(BOOTSTRAP_CHUNK_SIZE, BOOTSTRAP_SAMPLE_COUNT - start)
+        for start in range(0, BOOTSTRAP_SAMPLE_COUNT, BOOTSTRAP_CHUNK_SIZE)
+    ]
+    seeds = SeedSequence(int(rng.integers(2**63))).spawn(len(chunk_sizes))
+    sample_chunk = partial(weighted_bootstrap_means, values)
+    chunk_rngs = map(default_rng, seeds)
+
+    if BOOTSTRAP_SAMPLE_COUNT * values.size < PARALLEL_BOOTSTRAP_MIN_SIZE:
+        return concatenate(list(map(sample_chunk, chunk_sizes, chunk_rngs)))
+
+    # Threads suffice, as NumPy releases the GIL for both the draws and the
+    # matrix products, and avoid copying values to other processes
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return concatenate(list(executor.map(sample_chunk, chunk_sizes, chunk_rngs)))
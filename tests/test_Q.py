@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from flow_analysis.measurements.Q import Q_fit, flat_bin_Qs, gaussian_initial_guess
+
+
+class QHistoryEnsemble:
+    # Just enough of a FlowEnsemble for Q_fit
+    def __init__(self, Q_history):
+        self._Q_history = Q_history
+
+    def Q_history(self, t="L/2"):
+        return self._Q_history
+
+    def Q_history_int(self, t="L/2"):
+        return np.rint(self._Q_history).astype(np.int64)
+
+
+def offset_narrow_Q_history(Q0=5, sigma=0.4, count=400):
+    return np.random.default_rng(1).normal(Q0, sigma, size=count)
+
+
+@pytest.mark.parametrize("dtype", [np.int32, np.int64, np.uint8, np.uint64])
+def test_flat_bin_integer_Qs(dtype):
+    Q_range, Q_counts = flat_bin_Qs(np.array([0, 1, 1, 3], dtype=dtype))
+
+    assert_array_equal(Q_range, np.arange(-4, 5))
+    assert_array_equal(Q_counts, [0, 0, 0, 0, 1, 2, 0, 1, 0])
+
+
+def test_initial_guess_offset_narrow_peak():
+    Q_range, Q_counts = flat_bin_Qs(offset_narrow_Q_history())
+    guess = gaussian_initial_guess(Q_range, Q_counts)
+
+    assert guess is not None
+    A, Q0, sigma = guess
+    assert abs(Q0 - 5) < 0.5
+    assert 0 < sigma < 1
+
+
+def test_initial_guess_too_few_bins():
+    Q_range, Q_counts = flat_bin_Qs(np.array([3, 3, 4, 4, 4]))
+    assert gaussian_initial_guess(Q_range, Q_counts) is None
+
+
+def test_Q_fit_offset_narrow_peak():
+    Q0, sigma = Q_fit(QHistoryEnsemble(offset_narrow_Q_history()))
+
+    assert abs(Q0.nominal_value - 5) < 0.1
+    assert abs(abs(sigma.nominal_value) - 0.4) < 0.1
+    assert Q0.std_dev < 0.1
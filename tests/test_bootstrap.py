@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from numpy.random import default_rng
+
+from flow_analysis.stats import bootstrap
+from flow_analysis.stats.bootstrap import BOOTSTRAP_SAMPLE_COUNT, sample_bootstrap_1d
+
+
+def test_sample_bootstrap_1d_independent_of_size():
+    # The samples of each column must be the same however many columns
+    # are bootstrapped together, so large ensembles aren't treated differently
+    values = default_rng(1).random((1000, 400))
+
+    samples = sample_bootstrap_1d(values, rng=default_rng(2))
+    first_samples = sample_bootstrap_1d(values[:, :4], rng=default_rng(2))
+
+    assert samples.shape == (BOOTSTRAP_SAMPLE_COUNT, 400)
+    np.testing.assert_allclose(samples[:, :4], first_samples)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_sample_bootstrap_1d_parallel_matches_serial(monkeypatch, max_workers):
+    values = default_rng(1).random((50, 7))
+    serial_samples = sample_bootstrap_1d(values, rng=default_rng(2))
+
+    monkeypatch.setattr(bootstrap, "PARALLEL_BOOTSTRAP_MIN_SIZE", 0)
+    parallel_samples = sample_bootstrap_1d(
+        values, rng=default_rng(2), max_workers=max_workers
+    )
+
+    np.testing.assert_array_equal(parallel_samples, serial_samples)
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from flow_analysis.readers import cache
+from flow_analysis.readers.read_hp import read_flows_hp
+
+# Bypass the in-memory cache, to exercise the one on disk
+read_flows_hp_uncached = read_flows_hp.__wrapped__
+
+
+def write_hp_log(path, configuration_count=3, step_count=4):
+    with open(path, "w") as f:
+        for configuration in range(1, configuration_count + 1):
+            for step in range(1, step_count + 1):
+                f.write(f"{configuration} {0.1 * step} {1 / step} {0.9 / step}\n")
+
+
+@pytest.fixture
+def cache_directory(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    monkeypatch.setattr(cache, "CACHE_DIRECTORY", directory)
+    return directory
+
+
+def test_default_directory_is_per_user(monkeypatch, tmp_path):
+    monkeypatch.delenv("FLOW_ANALYSIS_NO_CACHE", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache.default_cache_directory() == tmp_path / "flow_analysis"
+
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    assert cache.default_cache_directory() == Path.home() / ".cache/flow_analysis"
+
+
+def test_disable_with_environment(monkeypatch):
+    monkeypatch.setenv("FLOW_ANALYSIS_NO_CACHE", "1")
+    assert cache.default_cache_directory() is None
+
+
+def test_round_trip(tmp_path, cache_directory):
+    log_path = tmp_path / "flows.dat"
+    write_hp_log(log_path)
+
+    read = read_flows_hp_uncached(log_path)
+    (cached_path,) = cache_directory.glob("flow_*.npz")
+    cached = read_flows_hp_uncached(log_path)
+
+    assert cached.plaquettes is None
+    np.testing.assert_array_equal(cached.trajectories, read.trajectories)
+    np.testing.assert_array_equal(cached.Eps, read.Eps)
+
+
+def test_prune(tmp_path, cache_directory, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 2)
+    for index in range(3):
+        log_path = tmp_path / f"flows{index}.dat"
+        write_hp_log(log_path, configuration_count=index + 1)
+        read_flows_hp_uncached(log_path)
+
+    assert len(list(cache_directory.glob("flow_*.npz"))) == 2
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from flow_analysis.fit_forms import exp_decay, gaussian
+
+ARGUMENTS = [
+    np.arange(-3, 4),
+    np.linspace(-3, 3, 7),
+    1.5,
+    2,
+    np.linspace(-3, 3, 12).reshape(3, 4),
+]
+
+
+@pytest.mark.parametrize("x", ARGUMENTS)
+def test_gaussian(x):
+    expected = 2.0 * np.exp(-((np.asarray(x) - 0.5) ** 2) / (2 * 1.5**2))
+    np.testing.assert_allclose(gaussian(x, 2.0, 0.5, 1.5), expected)
+
+
+@pytest.mark.parametrize("x", ARGUMENTS)
+def test_exp_decay(x):
+    np.testing.assert_allclose(exp_decay(x, 2.0), np.exp(-np.asarray(x) / 2.0))
@@ -0,0 +1,46 @@
+from numpy import arange, ones
+from numpy.testing import assert_array_equal
+
+from flow_analysis.flow import Flow, FlowEnsemble, FlowStep
+
+
+def test_append_after_empty_extend():
+    flow = Flow()
+    flow.extend_arrays(arange(0), arange(0), arange(0), None)
+    flow.append(FlowStep(0.1, 1.0, 2.0, 3.0))
+    flow.append(FlowStep(0.2, 1.5, 2.5, 3.5))
+
+    assert_array_equal(flow.times, [0.1, 0.2])
+    assert_array_equal(flow.Qs, [3.0, 3.5])
+
+
+def test_append_after_finalize():
+    flow = Flow(n_steps=4)
+    flow.extend_arrays(arange(0), arange(0), arange(0), None)
+    flow.finalize()
+    flow.append(FlowStep(0.1, 1.0, 2.0, 3.0))
+    flow.append(FlowStep(0.2, 1.5, 2.5, 3.5))
+    flow.extend_arrays(arange(3, 5) / 10, ones(2), ones(2), ones(2))
+
+    assert_array_equal(flow.times, [0.1, 0.2, 0.3, 0.4])
+    assert_array_equal(flow.Eps, [1.0, 1.5, 1.0, 1.0])
+
+
+def test_freeze_without_trajectories():
+    ensemble = FlowEnsemble("flows.dat")
+    for _ in range(2):
+        flow = Flow()
+        flow.extend_arrays(arange(1, 4) / 10, ones(3), ones(3), None)
+        ensemble.append(flow)
+    ensemble.freeze()
+
+    assert list(ensemble.trajectories) == [None, None]
+    assert ensemble.Eps.shape == (2, 3)
+
+
+def test_freeze_empty_ensemble():
+    ensemble = FlowEnsemble("flows.dat")
+    ensemble.freeze()
+
+    assert len(ensemble) == 0
+    assert ensemble.Eps.shape == (0, 0)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from flow_analysis.readers.read_hdf5 import read_flows_hdf5
+
+h5py = pytest.importorskip("h5py")
+
+TIMES = np.linspace(0.5, 6.0, 12)
+
+
+@pytest.fixture
+def hdf5_filename(tmp_path):
+    filename = tmp_path / "flows.h5"
+    rng = np.random.default_rng(1)
+    with h5py.File(filename, "w") as f:
+        f["lattice"] = [16, 8, 8, 8]
+        f["beta"] = 2.0
+        f["quarkmasses"] = -0.5
+        f["ensemble names"] = np.array([b"A"] * 5)
+        f["trajectory indices"] = np.arange(5)
+        f["flow times"] = TIMES
+        f["configurations"] = np.array([f"cfg{index}".encode() for index in range(5)])
+        f["energy density plaq"] = rng.random((5, len(TIMES)))
+        f["energy density sym"] = rng.random((5, len(TIMES)))
+        f["topological charge"] = rng.normal(size=(5, len(TIMES)))
+    return filename
+
+
+def test_default_Q_history_is_lazy(hdf5_filename):
+    ensemble = read_flows_hdf5(hdf5_filename)
+    assert "Qs" not in ensemble._arrays
+
+    Q_history = ensemble.Q_history()
+    assert "Qs" not in ensemble._arrays
+
+    with h5py.File(hdf5_filename, "r") as f:
+        Qs = f["topological charge"][()]
+    # L = 8, so t = L^2 / 32 = 2
+    np.testing.assert_array_equal(Q_history, Qs[:, TIMES == 2.0][:, 0])
+    assert ensemble.Q_history() is Q_history
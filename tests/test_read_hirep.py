@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from flow_analysis.readers import cache
+from flow_analysis.readers.read_hirep import read_flows_hirep
+
+CONFIGURATION_COUNT = 3
+TIMES = np.arange(1, 5) * 0.05
+
+
+def expected_values(configuration):
+    Eps = 1 / TIMES + configuration
+    Ecs = 0.9 * Eps
+    Qs = configuration + TIMES / 3
+    return Eps, Ecs, Qs
+
+
+def write_hirep_log(
+    path,
+    configuration_count=CONFIGURATION_COUNT,
+    step_count=len(TIMES),
+    ncnfg=False,
+    mode="w",
+):
+    with open(path, mode) as f:
+        f.write("[GEOMETRY][0]Global size is 16x8x8x8\n")
+        f.write("[MAIN][0]Some other line\n\n")
+        for configuration in range(configuration_count):
+            f.write(
+                "[IO][0]Configuration "
+                f"[/path/to/run_8x8x8x8nc2b2.0m-0.5n{100 + configuration}] "
+                f"read from file, Plaquette={0.5 + configuration / 100!r}\n"
+            )
+            Eps, Ecs, Qs = expected_values(configuration)
+            rows = zip(TIMES.tolist(), Eps.tolist(), Ecs.tolist(), Qs.tolist())
+            for t, Ep, Ec, Q in list(rows)[:step_count]:
+                values = f"{t!r} {Ep!r} {t * t * Ep!r} {Ec!r} {t * t * Ec!r} {Q!r}"
+                if ncnfg:
+                    f.write(
+                        "[WILSONFLOW][0]WF (ncnfg,t,E,t2*E,Esym,t2*Esym,TC) = "
+                        f"{configuration + 1} {values}\n"
+                    )
+                else:
+                    f.write(
+                        f"[WILSONFLOW][0]WF (t,E,t2*E,Esym,t2*Esym,TC) = {values}\n"
+                    )
+
+
+@pytest.fixture(autouse=True)
+def no_disk_cache(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIRECTORY", None)
+
+
+@pytest.mark.parametrize("ncnfg", [False, True])
+def test_read_values(tmp_path, ncnfg):
+    log_path = tmp_path / "out_wflow"
+    write_hirep_log(log_path, ncnfg=ncnfg)
+
+    flows = read_flows_hirep(log_path)
+
+    assert flows.metadata == {
+        "flow_type": "Wilson",
+        "NT": 16,
+        "NX": 8,
+        "NY": 8,
+        "NZ": 8,
+    }
+    np.testing.assert_array_equal(flows.trajectories, [100, 101, 102])
+    # The run name starts as late as possible; see CFG_FILENAME
+    np.testing.assert_array_equal(flows.ensemble_names, ["_8x8x8x8nc2b2.0m-0.5"] * 3)
+    np.testing.assert_array_equal(flows.plaquettes, [0.5, 0.51, 0.52])
+    np.testing.assert_array_equal(flows.times, TIMES)
+    for configuration in range(CONFIGURATION_COUNT):
+        Eps, Ecs, Qs = expected_values(configuration)
+        np.testing.assert_array_equal(flows.Eps[configuration], Eps)
+        np.testing.assert_array_equal(flows.Ecs[configuration], Ecs)
+        np.testing.assert_array_equal(flows.Qs[configuration], Qs)
+
+
+@pytest.mark.parametrize("ncnfg", [False, True])
+def test_metadata_callback(tmp_path, ncnfg):
+    log_path = tmp_path / "out_wflow"
+    write_hirep_log(log_path, ncnfg=ncnfg)
+    lines = []
+
+    def metadata_callback(metadata, line_contents):
+        lines.append(line_contents)
+
+    flows = read_flows_hirep(log_path, metadata_callback=metadata_callback)
+    plain_flows = read_flows_hirep(log_path)
+
+    # Every non-empty line is passed on, and the flows are read as without it
+    assert len(lines) == 2 + CONFIGURATION_COUNT * (1 + len(TIMES))
+    np.testing.assert_array_equal(flows.Eps, plain_flows.Eps)
+    np.testing.assert_array_equal(flows.Qs, plain_flows.Qs)
+
+
+def test_truncated_last_flow(tmp_path):
+    # A flow cut short must not be broadcast across its row when frozen,
+    # even though HiRep logs aren't checked for consistency by default
+    log_path = tmp_path / "out_wflow"
+    write_hirep_log(log_path)
+    write_hirep_log(log_path, configuration_count=1, step_count=1, mode="a")
+
+    with pytest.raises(ValueError, match="not a consistent length"):
+        read_flows_hirep(log_path)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from flow_analysis.flow import Flow, FlowEnsemble
+from flow_analysis.measurements.scales import compute_bs_Es
+from flow_analysis.stats import bootstrap
+
+
+def make_ensemble(configuration_count=10, step_count=5):
+    rng = np.random.default_rng(1)
+    ensemble = FlowEnsemble("flows.dat")
+    times = np.linspace(0.1, 0.5, step_count)
+    for trajectory in range(configuration_count):
+        flow = Flow(trajectory=trajectory)
+        flow.extend_arrays(times, rng.random(step_count), rng.random(step_count), None)
+        ensemble.append(flow)
+    ensemble.freeze()
+    return ensemble
+
+
+def test_bs_Es_cache_follows_sample_count(monkeypatch):
+    ensemble = make_ensemble()
+    assert compute_bs_Es(ensemble, "sym") is compute_bs_Es(ensemble, "sym")
+
+    monkeypatch.setattr(bootstrap, "BOOTSTRAP_SAMPLE_COUNT", 50)
+    assert compute_bs_Es(ensemble, "sym").shape == (50, 5)
+
+
+def test_bs_Es_cache_follows_seed():
+    ensemble = make_ensemble()
+    bs_Es = compute_bs_Es(ensemble, "sym")
+
+    ensemble._rng_seed = ensemble.rng_seed + 1
+    assert not np.array_equal(compute_bs_Es(ensemble, "sym"), bs_Es)